@@ -5,10 +5,9 @@ Code Structure:
 1. Initialize Pygame and set up the screen and constants.
 2. Define auxiliary functions for drawing the grid, positions, and applying rules.
 3. Define a function to generate random positions within the grid.
-4. Define a function to count live neighbors for a given position.
-5. Define a function to apply the rules of Conway's Game of Life.
-6. Define the main function to run the simulation and handle user interactions.
-7. Run the main function if this script is executed directly.
+4. Define a function to apply the rules of Conway's Game of Life.
+5. Define the main function to run the simulation and handle user interactions.
+6. Run the main function if this script is executed directly.
 
 Rules:
 1. Any live cell with fewer than two live neighbours dies, as if by underpopulation.
@@ -17,8 +16,17 @@ Rules:
 4. Any dead cell with exactly three live neighbours becomes a live cell, as if by reproduction.
 
 '''
+import math
+import numpy as np
 import pygame
-import random
+import time
+from collections import Counter
+from numba import njit, prange
+
+try:
+    import cupy as cp # optional, only needed for STEP_METHOD = "gpu"
+except ImportError:
+    cp = None
 
 #initializes pygame library for graphical operations
 pygame.init()
@@ -38,7 +46,49 @@ GREEN = (0, 255, 0)
 # Simulation Parameters
 FPS = 60 # frame rate for simulation
 UPDATE_FREQ = 2 # update rate for grid drawing
+ADAPTIVE_UPDATE = True # update as often as the measured update time allows instead of every UPDATE_FREQ frames
+UPDATE_TIME_SMOOTHING = 0.1 # weight of the latest update time in its moving average
 RANDOM_DENSITY = 0.5 # density of random positions in grid
+STEP_METHOD = "bitboard" # "stencil" updates one cell at a time, "bitboard" updates 64 cells per word operation,
+                         # "gpu" updates every cell in parallel on a CUDA GPU (requires cupy),
+                         # "hashlife" memoizes repeating blocks (requires ROWS == COLS to be a power of two)
+HASHLIFE_GENERATIONS_LOG2 = 0 # each hashlife update advances 2 ** this many generations, at most ROWS // 2
+HASHLIFE_MAX_MISSES = ROWS * COLS // 64 # above this many blocks computed in one update, hashlife falls back to the bitboard
+HASHLIFE_REBUILT_MAX_MISSES = 8 * HASHLIFE_MAX_MISSES # same for the first update of a new grid, which starts with a cold memo
+HASHLIFE_FALLBACK_UPDATES = 60 # number of bitboard updates before hashlife is tried again, doubled after each failed retry
+HASHLIFE_MAX_FALLBACK_UPDATES = 60 * 64 # upper bound of the doubled number of bitboard updates
+HASHLIFE_MAX_NODES = 1000000 # the hashlife memo is cleared when it holds more blocks than this
+MAX_DIRTY_CELLS = 2000 # above this number of changed cells the whole screen is redrawn instead of each changed cell
+SPARSE_DENSITY = 0.0002 # below this density of live cells only the live cells and their neighbors are updated
+
+# Cells in a set are stored as the flat index y * COLS + x
+# Wrap tables: what to add to the index of a cell in column x / row y to reach the cell on its left/right
+# or above/below, wrapping around the edges
+LEFT_STEPS = [-1 if x > 0 else COLS - 1 for x in range(COLS)]
+RIGHT_STEPS = [1 if x < COLS - 1 else 1 - COLS for x in range(COLS)]
+ABOVE_STEPS = [-COLS if y > 0 else (ROWS - 1) * COLS for y in range(ROWS)]
+BELOW_STEPS = [COLS if y < ROWS - 1 else (1 - ROWS) * COLS for y in range(ROWS)]
+
+def next_state(neighborhood):
+    """
+    Next state of a cell from its 3x3 neighborhood packed into 9 bits, column by column from the top left,
+    so the cell itself is bit 4
+    """
+    center = (neighborhood >> 4) & 1
+    n = bin(neighborhood).count("1") - center # live neighbors
+    return n == 3 or (center and n == 2)
+
+NEXT_STATE_LUT = np.array([next_state(neighborhood) for neighborhood in range(512)], dtype=np.uint8)
+
+# Bitboard layout: each row is packed into WORDS uint64 words, bit i of word j is the cell at column 64 * j + i
+WORDS = (COLS + 63) // 64
+LAST_WORD_MASK = np.uint64((1 << (COLS - 64 * (WORDS - 1))) - 1) # live bits of the last word, the rest is padding
+LAST_COL_BIT = np.uint64((COLS - 1) % 64) # position of column COLS - 1 in the last word
+
+if STEP_METHOD == "gpu" and cp is None:
+    raise ImportError('STEP_METHOD = "gpu" requires cupy, install the build matching your CUDA version, e.g. pip install cupy-cuda12x')
+if STEP_METHOD == "hashlife" and (ROWS != COLS or ROWS & (ROWS - 1) or 2 ** HASHLIFE_GENERATIONS_LOG2 > ROWS // 2):
+    raise ValueError('STEP_METHOD = "hashlife" requires ROWS == COLS to be a power of two and 2 ** HASHLIFE_GENERATIONS_LOG2 <= ROWS // 2')
 
 # clock to control the frame rate
 clock = pygame.time.Clock()
@@ -46,6 +96,17 @@ clock = pygame.time.Clock()
 # pygame window, leave room for instructions window
 screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
 
+# only queue the events handled by the main loop, so mouse motion and other events are never turned into objects
+pygame.event.set_blocked(None)
+pygame.event.set_allowed([pygame.QUIT, pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN, pygame.VIDEOEXPOSE])
+
+# buffers reused every frame to draw the live cells: one pixel per cell, then scaled to the tile size
+CELL_COLORS = np.array([BLACK, GREEN], dtype=np.uint8) # color of dead and live cells, dead cells are transparent
+cells_rgb = np.zeros((COLS, ROWS, 3), dtype=np.uint8)
+cells_surface = pygame.Surface((COLS, ROWS))
+scaled_cells_surface = pygame.Surface((COLS * TILE_SIZE, ROWS * TILE_SIZE))
+scaled_cells_surface.set_colorkey(BLACK)
+
 
 def draw_grid(screen):
     """
@@ -66,172 +127,599 @@ def draw_grid(screen):
     for col in range(COLS):
         pygame.draw.line(screen, BLACK, (col * TILE_SIZE, 0), (col * TILE_SIZE, SCREEN_HEIGHT), GRID_THICKNESS)
 
-def draw_positions(screen, grid_positions):
+# the grid lines never change, so they are drawn once on a background that is blitted every frame
+grid_background = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+grid_background.fill(GRAY)
+draw_grid(grid_background)
+
+def draw_positions(screen, grid):
     """
-    Draw the current live cells positions on the Pygame screen.
+    Draw the current live cells on the Pygame screen.
 
     Args:
         screen (pygame.Surface): The Pygame surface to draw on.
-        grid_positions (set): A set of positions to be drawn.
-        color (tuple): The color of the grid positions in RGB format.
-        tile_size (int): The size of each grid tile in pixels.
+        grid (np.ndarray): A (ROWS, COLS) uint8 array, 1 for live cells and 0 for dead ones.
     """
-    for position in grid_positions:
-        grid_x, grid_y = position
-        pygame.draw.rect(screen, GREEN, (grid_x * TILE_SIZE, grid_y * TILE_SIZE, TILE_SIZE, TILE_SIZE))
+    # surfarray is indexed as (x, y), hence the transpose
+    np.take(CELL_COLORS, grid.T, axis=0, out=cells_rgb)
+    pygame.surfarray.blit_array(cells_surface, cells_rgb)
+    pygame.transform.scale(cells_surface, scaled_cells_surface.get_size(), scaled_cells_surface)
+    screen.blit(scaled_cells_surface, (0, 0))
 
-def generate_random_grid_positions():
+def draw_changed_cells(screen, grid, changed_cells):
     """
-    Generate a set of random positions within the grid.
+    Redraw only the cells that changed since the last frame.
 
     Args:
-        rows (int): The number of rows in the grid.
-        cols (int): The number of columns in the grid.
+        screen (pygame.Surface): The Pygame surface to draw on.
+        grid (np.ndarray): A (ROWS, COLS) uint8 array, 1 for live cells and 0 for dead ones.
+        changed_cells (list): The [y, x] indexes of the cells that changed.
+
+    Returns:
+        list: The pygame.Rect of every redrawn cell, to pass to pygame.display.update.
+    """
+    dirty_rects = []
+    for grid_y, grid_x in changed_cells:
+        rect = pygame.Rect(grid_x * TILE_SIZE, grid_y * TILE_SIZE, TILE_SIZE, TILE_SIZE)
+        if grid[grid_y, grid_x]:
+            screen.fill(GREEN, rect)
+        else:
+            screen.blit(grid_background, rect, rect) # restore the background and its grid lines
+        dirty_rects.append(rect)
+    return dirty_rects
+
+def grid_to_positions(grid):
+    """
+    Convert a grid array into a set of positions.
+
+    Args:
+        grid (np.ndarray): A (ROWS, COLS) uint8 array of live cells.
+
+    Returns:
+        set: A set of live cells as flat indexes y * COLS + x.
+    """
+    return set(np.flatnonzero(grid != 0).tolist()) # nonzero is much faster on bools than on uint8
+
+def generate_random_grid():
+    """
+    Generate a grid with random live cells.
 
     Returns:
-        set: A set of randomly generated positions within the grid.
+        np.ndarray: A grid with randomly generated live cells.
     """
-    random_grid_positions = set()
-    for y in range(0, ROWS):
-        for x in range(0, COLS):
-            if random.random() < RANDOM_DENSITY:
-                random_pos = (x, y)
-                random_grid_positions.add(random_pos)
-    return random_grid_positions
+    return (np.random.random((ROWS, COLS)) < RANDOM_DENSITY).astype(np.uint8)
 
 def generate_pattern():
     """
-    Generate a set of positions in a pattern within the grid.
+    Generate a grid with the pattern cells alive.
+
+    Returns:
+        np.ndarray: A grid with the pattern cells alive.
+    """
+    y, x = np.ogrid[:ROWS, :COLS] # broadcast together into (ROWS, COLS) arrays
+    center_x, center_y = COLS // 2, ROWS // 2
+    squared_distance = (x - center_x) ** 2 + (y - center_y) ** 2
+
+    pattern = ((x == center_x) | (y == center_y) # cross pattern
+               | (x == y) | (x == COLS - y) # x pattern
+               | ((((ROWS - 10) // 2) ** 2 < squared_distance) & (squared_distance < (ROWS // 2) ** 2)) # circle pattern
+               | (y == center_y - (x - center_x) ** 2 // 100) # parabolic pattern
+               | (y == center_y - (x - center_x) ** 4 // 1000000)) # forth grade equation pattern
+    return pattern.astype(np.uint8)
+
+@njit(cache=True, parallel=True, boundscheck=False)
+def step(grid, updated_grid):
     """
-    pattern_grid_positions = set()
-    for y in range(0, ROWS):
-        for x in range(0, COLS):
-                if x == COLS // 2 or y == ROWS // 2: # cross pattern
-                    pattern_grid_positions.add((x,y))
-                if x == y or x == COLS - y: # x pattern
-                    pattern_grid_positions.add((x,y))
-                if ((ROWS - 10) // 2) ** 2 < (x - COLS // 2) ** 2 + (y - ROWS // 2) ** 2 < (ROWS // 2) ** 2: # circle pattern
-                    pattern_grid_positions.add((x,y))
-                if y == (ROWS // 2) - (x - COLS // 2) ** 2 // 100: # parabolic pattern
-                    pattern_grid_positions.add((x,y))
-                if y == (ROWS // 2) - (x - COLS // 2) ** 4 // 1000000: # forth grade equation pattern
-                    pattern_grid_positions.add((x,y))
-    return pattern_grid_positions
+    Compute the next generation of the grid into a preallocated array.
+    Cells on the edge of the grid wrap around to the other side.
 
-def count_live_neighbors(grid_positions, position):
+    Args:
+        grid (np.ndarray): A (ROWS, COLS) uint8 array of live cells.
+        updated_grid (np.ndarray): A (ROWS, COLS) uint8 array that receives the next generation.
+
+    Returns:
+        np.ndarray: updated_grid, filled with the next generation.
     """
-    Count the live neighbors of a given position in the grid.
-    If the position is on the edge of the grid, wrap around to the other side.
+    rows, cols = grid.shape
+    # full rows are swept on purpose: the 3 rows read for each row fit in the L1 cache up to thousands
+    # of columns, and blocking the loops was measured slower as it keeps the inner loop from vectorizing
+    for y in prange(rows):
+        # explicit wrap instead of modulo so the compiler can drop the division
+        y_above = rows - 1 if y == 0 else y - 1
+        y_below = 0 if y == rows - 1 else y + 1
+
+        # the 3 cells of a column packed as 3 bits, the window slides right by shifting in one new column per cell
+        left_column = np.int64((grid[y_above, cols - 1] << 2) | (grid[y, cols - 1] << 1) | grid[y_below, cols - 1])
+        center_column = np.int64((grid[y_above, 0] << 2) | (grid[y, 0] << 1) | grid[y_below, 0])
+        for x in range(cols):
+            x_right = 0 if x == cols - 1 else x + 1
+            right_column = np.int64((grid[y_above, x_right] << 2) | (grid[y, x_right] << 1) | grid[y_below, x_right])
+
+            # a single table lookup replaces the neighbor sum and the rule comparisons
+            updated_grid[y, x] = NEXT_STATE_LUT[(left_column << 6) | (center_column << 3) | right_column]
+            left_column, center_column = center_column, right_column
+    return updated_grid
+
+def pack_grid(grid):
+    """
+    Pack a grid into a bitboard.
 
     Args:
-        grid_positions (set): A set of live positions in the grid.
-        position (tuple): The position to count neighbors for.
-        rows (int): The number of rows in the grid.
-        cols (int): The number of columns in the grid.
+        grid (np.ndarray): A (ROWS, COLS) uint8 array of live cells.
 
     Returns:
-        int: The count of live neighbors for the given position.
+        np.ndarray: A (ROWS, WORDS) uint64 array with one bit per cell.
     """
-    x, y = position
-    count_of_live_neighbors = 0
+    packed = np.zeros((ROWS, WORDS * 8), dtype=np.uint8)
+    packed[:, :(COLS + 7) // 8] = np.packbits(grid, axis=1, bitorder='little')
+    return packed.view('<u8')
 
-    # Define offsets for neighbors (we will check all surrounding cells)
-    offsets = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+def unpack_grid(board, grid):
+    """
+    Unpack a bitboard into a grid.
+
+    Args:
+        board (np.ndarray): A (ROWS, WORDS) uint64 array with one bit per cell.
+        grid (np.ndarray): A (ROWS, COLS) uint8 array that receives the cells.
 
-    for offset_x, offset_y in offsets:
-        neighbor_x = (x + offset_x) % COLS  # Wrap around for x
-        neighbor_y = (y + offset_y) % ROWS  # Wrap around for y
+    Returns:
+        np.ndarray: grid, filled with the cells of the board.
+    """
+    grid[:] = np.unpackbits(board.view(np.uint8), axis=1, count=COLS, bitorder='little')
+    return grid
 
-        neighbor_pos = (neighbor_x, neighbor_y)
-        if neighbor_pos in grid_positions:
-            count_of_live_neighbors += 1
+@njit(cache=True)
+def west_word(board, row, j):
+    """
+    Return word j of a bitboard row shifted so that bit x holds the cell at column x - 1, wrapping around.
+    """
+    words = board.shape[1]
+    if j == 0:
+        return (board[row, j] << np.uint64(1)) | ((board[row, words - 1] >> LAST_COL_BIT) & np.uint64(1))
+    return (board[row, j] << np.uint64(1)) | (board[row, j - 1] >> np.uint64(63))
 
-    return count_of_live_neighbors
+@njit(cache=True)
+def east_word(board, row, j):
+    """
+    Return word j of a bitboard row shifted so that bit x holds the cell at column x + 1, wrapping around.
+    """
+    words = board.shape[1]
+    if j == words - 1:
+        return (board[row, j] >> np.uint64(1)) | ((board[row, 0] & np.uint64(1)) << LAST_COL_BIT)
+    return (board[row, j] >> np.uint64(1)) | (board[row, j + 1] << np.uint64(63))
 
-def apply_rules(grid_positions):
+@njit(cache=True, parallel=True, boundscheck=False)
+def step_bitboard(board, updated_board):
     """
-    Apply Conway's Game of Life rules to update the grid positions.
+    Compute the next generation of a bitboard, 64 cells at a time.
+    The 8 neighbor words of each word are summed with bitwise adders into 3 bit planes,
+    so every bit position holds the neighbor count of its cell modulo 8.
 
     Args:
-        grid_positions (set): A set of live positions in the grid.
-        rows (int): The number of rows in the grid.
-        cols (int): The number of columns in the grid.
+        board (np.ndarray): A (ROWS, WORDS) uint64 array with one bit per cell.
+        updated_board (np.ndarray): A (ROWS, WORDS) uint64 array that receives the next generation.
 
     Returns:
-        set: The updated set of live positions after applying the rules.
+        np.ndarray: updated_board, filled with the next generation.
+    """
+    rows, words = board.shape
+    for y in prange(rows):
+        y_above = rows - 1 if y == 0 else y - 1
+        y_below = 0 if y == rows - 1 else y + 1
+        for j in range(words):
+            neighbors = (west_word(board, y_above, j), board[y_above, j], east_word(board, y_above, j),
+                         west_word(board, y, j), east_word(board, y, j),
+                         west_word(board, y_below, j), board[y_below, j], east_word(board, y_below, j))
+
+            count_bit0 = np.uint64(0)
+            count_bit1 = np.uint64(0)
+            count_bit2 = np.uint64(0)
+            for neighbor in neighbors:
+                carry0 = count_bit0 & neighbor
+                count_bit0 ^= neighbor
+                carry1 = count_bit1 & carry0
+                count_bit1 ^= carry0
+                count_bit2 ^= carry1
+
+            # alive with a count of 3, or 2 if already alive: bit2 clear, bit1 set, bit0 set or cell alive
+            updated_word = ~count_bit2 & count_bit1 & (count_bit0 | board[y, j])
+            if j == words - 1:
+                updated_word &= LAST_WORD_MASK
+            updated_board[y, j] = updated_word
+    return updated_board
+
+if cp is not None:
+    # one GPU thread per cell, i is the flat index of the cell in the (rows, cols) grid
+    step_gpu = cp.ElementwiseKernel(
+        'raw uint8 grid, int32 rows, int32 cols',
+        'uint8 updated_grid',
+        """
+        int y = i / cols, x = i % cols;
+        int y_above = y == 0 ? rows - 1 : y - 1, y_below = y == rows - 1 ? 0 : y + 1;
+        int x_left = x == 0 ? cols - 1 : x - 1, x_right = x == cols - 1 ? 0 : x + 1;
+        int count_of_live_neighbors = grid[y_above * cols + x_left] + grid[y_above * cols + x] + grid[y_above * cols + x_right]
+                                    + grid[y * cols + x_left] + grid[y * cols + x_right]
+                                    + grid[y_below * cols + x_left] + grid[y_below * cols + x] + grid[y_below * cols + x_right];
+        updated_grid = count_of_live_neighbors == 3 || (grid[i] && count_of_live_neighbors == 2);
+        """,
+        'step_gpu')
+
+class GpuBoard:
+    """
+    Grid kept in GPU memory between updates: it is only uploaded again after the host grid was edited,
+    and each update copies the result back to the host for drawing.
     """
-    updated_grid_positions = set()
-    for row in range(0, ROWS):
-        for col in range(0, COLS):
-            position = (row, col)
-            count_of_live_neighbors = count_live_neighbors(grid_positions, position)
-            
-            # check the cases of living to the next generation, other cases are dead
-            if (position in grid_positions and (count_of_live_neighbors == 2 or count_of_live_neighbors == 3)): #lives
-                updated_grid_positions.add(position)
-            elif count_of_live_neighbors == 3 and position not in grid_positions: #reproduction
-                updated_grid_positions.add(position)
 
-    return updated_grid_positions
+    def __init__(self):
+        self.grid_gpu = None # grid on the GPU
+        self.updated_grid_gpu = None # second GPU buffer, receives the next generation
+        self.board_grid = None # host copy of the last grid returned by step, to detect edits made to it since
+
+    def step(self, grid, updated_grid):
+        """
+        Advance the grid one generation on the GPU.
+
+        Returns:
+            np.ndarray: updated_grid, filled with the result.
+        """
+        if self.grid_gpu is None:
+            self.grid_gpu = cp.asarray(grid)
+            self.updated_grid_gpu = cp.empty_like(self.grid_gpu)
+        elif not np.array_equal(grid, self.board_grid):
+            self.grid_gpu.set(grid)
+        step_gpu(self.grid_gpu, ROWS, COLS, self.updated_grid_gpu)
+        self.grid_gpu, self.updated_grid_gpu = self.updated_grid_gpu, self.grid_gpu
+        self.grid_gpu.get(out=updated_grid)
+        self.board_grid = updated_grid.copy()
+        return updated_grid
+
+def step_bitboard_grid(grid, updated_grid, generations=1):
+    """
+    Advance a grid by the given number of generations with the bitboard kernel.
 
-def handle_event(event, grid_positions, count, playing, running, iteration):
+    Args:
+        grid (np.ndarray): A (ROWS, COLS) uint8 array of live cells.
+        updated_grid (np.ndarray): A (ROWS, COLS) uint8 array that receives the result.
+        generations (int): The number of generations to advance.
+
+    Returns:
+        np.ndarray: updated_grid, filled with the result.
+    """
+    board = pack_grid(grid)
+    for _ in range(generations):
+        board = step_bitboard(board, np.empty_like(board))
+    return unpack_grid(board, updated_grid)
+
+def step_sparse(grid_positions):
+    """
+    Compute the next generation from the set of live positions only.
+    Each live cell adds one to the count of its 8 neighbors, so only cells next to a live cell are visited,
+    which beats sweeping the whole grid when very few cells are alive.
+
+    Args:
+        grid_positions (set): A set of live cells as flat indexes y * COLS + x.
+
+    Returns:
+        set: The set of live cells in the next generation.
+    """
+    neighbor_counts = Counter()
+    for position in grid_positions:
+        y, x = divmod(position, COLS)
+        left, right = position + LEFT_STEPS[x], position + RIGHT_STEPS[x]
+        above, below = ABOVE_STEPS[y], BELOW_STEPS[y]
+        for neighbor_pos in (left + above, position + above, right + above,
+                             left, right,
+                             left + below, position + below, right + below):
+            neighbor_counts[neighbor_pos] += 1
+
+    return {position for position, count_of_live_neighbors in neighbor_counts.items()
+            if count_of_live_neighbors == 3 or (count_of_live_neighbors == 2 and position in grid_positions)}
+
+def apply_sparse_rules(grid, grid_positions):
+    """
+    Advance a nearly empty grid one generation from its set of live cells, kept between updates,
+    so that neither the update nor finding the changed cells scans the whole grid.
+
+    Args:
+        grid (np.ndarray): A (ROWS, COLS) uint8 array of live cells, updated in place.
+        grid_positions (set): The live cells of grid as flat indexes y * COLS + x.
+
+    Returns:
+        tuple: The set of live cells in the next generation, and the [y, x] indexes of the cells that changed.
+    """
+    updated_positions = step_sparse(grid_positions)
+    changed_positions = list(grid_positions ^ updated_positions)
+    grid.flat[changed_positions] ^= 1
+    return updated_positions, [divmod(position, COLS) for position in changed_positions]
+
+class Node:
+    """
+    A square block of 2 ** level cells per side in the Hashlife quadtree.
+    Blocks are interned by Hashlife.join, so equal blocks are the same object and are cached by identity.
+    """
+    __slots__ = ('level', 'nw', 'ne', 'sw', 'se', 'population', 'successors', 'cells')
+
+    def __init__(self, level, nw, ne, sw, se, population):
+        self.level = level
+        self.nw, self.ne, self.sw, self.se = nw, ne, sw, se # quadrants, None for single cells
+        self.population = population
+        self.successors = {} # j -> center block 2 ** j generations later
+        self.cells = None # uint8 array of the block, only computed for small blocks
+
+DEAD_CELL = Node(0, None, None, None, None, 0)
+LIVE_CELL = Node(0, None, None, None, None, 1)
+CELLS_CACHE_LEVEL = 4 # blocks up to this level keep their cells as an array to speed up drawing
+
+def node_cells(node):
+    """
+    Return the cells of a small block as a uint8 array, computed once per block.
+
+    Args:
+        node (Node): A block of level CELLS_CACHE_LEVEL or lower.
+
+    Returns:
+        np.ndarray: A (2 ** level, 2 ** level) uint8 array of live cells.
+    """
+    if node.cells is None:
+        if node.level == 0:
+            node.cells = np.array([[node.population]], dtype=np.uint8)
+        else:
+            node.cells = np.block([[node_cells(node.nw), node_cells(node.ne)],
+                                   [node_cells(node.sw), node_cells(node.se)]])
+    return node.cells
+
+class HashlifeMissing(Exception):
+    """
+    Raised when an update computes more blocks than its budget, i.e. memoization is not paying off.
+    """
+
+class Hashlife:
+    """
+    Hashlife stepping of the toroidal grid: the grid is a quadtree of interned blocks (Node), and the future of
+    every block is memoized, so blocks that repeat in space or time, like still lifes and oscillators,
+    are only computed once.
+    """
+
+    def __init__(self):
+        self.nodes = {} # (nw, ne, sw, se) -> Node
+        self.board = None # Node of the last grid returned by step
+        self.board_grid = None # copy of that grid, to detect edits made to it since
+        self.misses = 0 # number of block futures computed, i.e. not found in the memo
+        self.max_misses = HASHLIFE_MAX_MISSES # misses allowed in the current update
+        self.fallback_updates = 0 # number of updates left to be done by the bitboard
+        self.fallback_length = HASHLIFE_FALLBACK_UPDATES # number of bitboard updates after the next failure
+
+    def join(self, nw, ne, sw, se):
+        """
+        Return the interned block made of the four given quadrants.
+        """
+        key = (nw, ne, sw, se)
+        node = self.nodes.get(key)
+        if node is None:
+            node = self.nodes[key] = Node(nw.level + 1, nw, ne, sw, se,
+                                          nw.population + ne.population + sw.population + se.population)
+        return node
+
+    def center(self, node):
+        """
+        Return the center half of a block, one level below it.
+        """
+        return self.join(node.nw.se, node.ne.sw, node.sw.ne, node.se.nw)
+
+    def successor(self, node, j):
+        """
+        Return the center half of a block 2 ** j generations later (Gosper's algorithm).
+
+        Args:
+            node (Node): A block of level 2 or higher.
+            j (int): The log2 of the number of generations, at most node.level - 2.
+
+        Returns:
+            Node: The center block, one level below node.
+        """
+        result = node.successors.get(j)
+        if result is not None:
+            return result
+        self.misses += 1
+        if self.misses > self.max_misses:
+            raise HashlifeMissing
+
+        if node.population == 0:
+            result = node.nw
+        elif node.level == 2:
+            # read the 16 cells from the quadtree, building an array here costs more than the rule itself
+            nw, ne, sw, se = node.nw, node.ne, node.sw, node.se
+            cells = [[cell.population for cell in row] for row in ((nw.nw, nw.ne, ne.nw, ne.ne),
+                                                                   (nw.sw, nw.se, ne.sw, ne.se),
+                                                                   (sw.nw, sw.ne, se.nw, se.ne),
+                                                                   (sw.sw, sw.se, se.sw, se.se))]
+            next_cells = []
+            for y, x in ((1, 1), (1, 2), (2, 1), (2, 2)):
+                count_of_live_neighbors = sum(cells[y - 1][x - 1:x + 2]) + cells[y][x - 1] + cells[y][x + 1] + sum(cells[y + 1][x - 1:x + 2])
+                alive = count_of_live_neighbors == 3 or (cells[y][x] and count_of_live_neighbors == 2)
+                next_cells.append(LIVE_CELL if alive else DEAD_CELL)
+            result = self.join(*next_cells)
+        else:
+            # the 9 overlapping sub-blocks one level down, each shifted by a quarter of the block
+            grandchildren = [[node.nw.nw, node.nw.ne, node.ne.nw, node.ne.ne],
+                             [node.nw.sw, node.nw.se, node.ne.sw, node.ne.se],
+                             [node.sw.nw, node.sw.ne, node.se.nw, node.se.ne],
+                             [node.sw.sw, node.sw.se, node.se.sw, node.se.se]]
+            subs = [[self.join(grandchildren[y][x], grandchildren[y][x + 1], grandchildren[y + 1][x], grandchildren[y + 1][x + 1])
+                     for x in range(3)] for y in range(3)]
+            if j == node.level - 2:
+                # advance the sub-blocks half the way now and the other half below
+                subs = [[self.successor(sub, j - 1) for sub in row] for row in subs]
+                remaining_j = j - 1
+            else:
+                subs = [[self.center(sub) for sub in row] for row in subs]
+                remaining_j = j
+            result = self.join(*(self.successor(self.join(subs[y][x], subs[y][x + 1], subs[y + 1][x], subs[y + 1][x + 1]), remaining_j)
+                                 for y, x in ((0, 0), (0, 1), (1, 0), (1, 1))))
+
+        node.successors[j] = result
+        return result
+
+    def grid_to_node(self, grid):
+        """
+        Build the block of a grid.
+
+        Args:
+            grid (np.ndarray): A square uint8 array of live cells, its side a power of two.
+
+        Returns:
+            Node: The interned block of the grid.
+        """
+        level = [[LIVE_CELL if cell else DEAD_CELL for cell in row] for row in grid.tolist()]
+        while len(level) > 1:
+            level = [[self.join(level[y][x], level[y][x + 1], level[y + 1][x], level[y + 1][x + 1])
+                      for x in range(0, len(level), 2)] for y in range(0, len(level), 2)]
+        return level[0][0]
+
+    def write_node(self, node, grid, y=0, x=0):
+        """
+        Write the cells of a block into a grid, with its top left corner at (x, y).
+        """
+        size = 2 ** node.level
+        if node.population == 0:
+            grid[y:y + size, x:x + size] = 0
+        elif node.level <= CELLS_CACHE_LEVEL:
+            grid[y:y + size, x:x + size] = node_cells(node)
+        else:
+            half = size // 2
+            self.write_node(node.nw, grid, y, x)
+            self.write_node(node.ne, grid, y, x + half)
+            self.write_node(node.sw, grid, y + half, x)
+            self.write_node(node.se, grid, y + half, x + half)
+
+    def step(self, grid, updated_grid):
+        """
+        Advance the grid by 2 ** HASHLIFE_GENERATIONS_LOG2 generations.
+        While memoization keeps missing, the grid is advanced with the bitboard kernel instead.
+
+        Args:
+            grid (np.ndarray): A (ROWS, COLS) uint8 array of live cells.
+            updated_grid (np.ndarray): A (ROWS, COLS) uint8 array that receives the result.
+
+        Returns:
+            np.ndarray: updated_grid, filled with the result.
+        """
+        generations = 2 ** HASHLIFE_GENERATIONS_LOG2
+        if self.fallback_updates > 0:
+            self.fallback_updates -= 1
+            return step_bitboard_grid(grid, updated_grid, generations)
+
+        rebuilt = self.board is None or len(self.nodes) > HASHLIFE_MAX_NODES or not np.array_equal(grid, self.board_grid)
+        if rebuilt:
+            if len(self.nodes) > HASHLIFE_MAX_NODES:
+                self.nodes.clear()
+            self.board = self.grid_to_node(grid)
+
+        # a new grid starts with a cold memo, so it gets a larger budget of misses
+        self.misses = 0
+        self.max_misses = HASHLIFE_REBUILT_MAX_MISSES if rebuilt else HASHLIFE_MAX_MISSES
+        try:
+            # the torus tiles the plane, so the center of 2 x 2 copies of the board is the board shifted by half its size
+            shifted = self.successor(self.join(self.board, self.board, self.board, self.board), HASHLIFE_GENERATIONS_LOG2)
+        except HashlifeMissing:
+            # give up on this update as soon as the budget is spent, and back off longer after each failed retry
+            self.board = None
+            self.fallback_updates = self.fallback_length
+            self.fallback_length = min(2 * self.fallback_length, HASHLIFE_MAX_FALLBACK_UPDATES)
+            return step_bitboard_grid(grid, updated_grid, generations)
+        self.board = self.join(shifted.se, shifted.sw, shifted.ne, shifted.nw)
+        if not rebuilt:
+            # the memo is paying off on this grid, a later failure starts backing off from scratch
+            self.fallback_length = HASHLIFE_FALLBACK_UPDATES
+
+        self.write_node(self.board, updated_grid)
+        self.board_grid = updated_grid.copy()
+        return updated_grid
+
+# hashlife memo, kept between updates
+hashlife = Hashlife()
+# GPU buffers, kept between updates
+gpu_board = GpuBoard()
+
+def apply_rules(grid, updated_grid):
+    """
+    Apply Conway's Game of Life rules to update the grid.
+    Uses the STEP_METHOD kernel, main updates nearly empty grids with apply_sparse_rules instead.
+    With hashlife, an update advances 2 ** HASHLIFE_GENERATIONS_LOG2 generations.
+
+    Args:
+        grid (np.ndarray): A (ROWS, COLS) uint8 array of live cells.
+        updated_grid (np.ndarray): A (ROWS, COLS) uint8 array that receives the next generation,
+            it must not be the same array as grid.
+
+    Returns:
+        np.ndarray: The updated grid after applying the rules.
+    """
+    if STEP_METHOD == "hashlife":
+        return hashlife.step(grid, updated_grid)
+    if STEP_METHOD == "bitboard":
+        return step_bitboard_grid(grid, updated_grid)
+    if STEP_METHOD == "gpu":
+        return gpu_board.step(grid, updated_grid)
+    return step(grid, updated_grid)
+
+def handle_event(event, grid, count, playing, running, iteration, adaptive_update):
     """
     Handle various events in the game.
 
     Args:
         event (pygame.event.Event): The event to handle.
-        grid_positions (set): The set of live positions in the grid.
+        grid (np.ndarray): The (ROWS, COLS) uint8 array of live cells.
         count (int): The count variable for game logic.
         playing (bool): Flag indicating if the game is currently playing.
         running (bool): Flag indicating if the game is running.
+        adaptive_update (bool): Flag indicating if the update rate follows the measured update time.
 
     Returns:
-        tuple: Updated grid positions, count, playing, and running flags.
+        tuple: Updated grid, count, playing, running, iteration and adaptive_update flags.
     """
     # quit event -> exit the game
     if event.type == pygame.QUIT:
         running = False
-    # keydown event -> pause, clear, randomize, or insert pattern the grid
+    # keydown event -> pause, clear, randomize, insert pattern the grid, or toggle the adaptive update rate
     elif event.type == pygame.KEYDOWN:
         if event.key == pygame.K_SPACE:
             playing = not playing
+        elif event.key == pygame.K_u:
+            adaptive_update = not adaptive_update
         elif event.key == pygame.K_c:
-            grid_positions.clear()
+            grid[:] = 0
             playing = False
             count = 0
             iteration = 0
         elif event.key == pygame.K_r:
-            grid_positions = generate_random_grid_positions()
+            grid = generate_random_grid()
             iteration = 0
         elif event.key == pygame.K_p:
-            grid_positions = generate_pattern()
+            grid = generate_pattern()
             iteration = 0
             playing = False
     # mouse click event -> add or remove a position from the grid
     elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
-        grid_positions = handle_mouse_click(grid_positions)
+        grid = handle_mouse_click(grid)
 
-    return grid_positions, count, playing, running, iteration
+    return grid, count, playing, running, iteration, adaptive_update
 
-def handle_mouse_click(grid_positions):
+def handle_mouse_click(grid):
     """
-    Handle mouse clicks to add or remove grid positions.
+    Handle mouse clicks to add or remove live cells.
 
     Args:
-        grid_positions (set): The set of live positions in the grid.
-        tile_size (int): The size of each grid tile in pixels.
+        grid (np.ndarray): The (ROWS, COLS) uint8 array of live cells.
 
     Returns:
-        set: Updated grid positions after handling the mouse click.
+        np.ndarray: Updated grid after handling the mouse click.
     """
     mouse_pos = pygame.mouse.get_pos()
-    grid_pos = (mouse_pos[0] // TILE_SIZE, mouse_pos[1] // TILE_SIZE)
-    if grid_pos in grid_positions:
-        grid_positions.remove(grid_pos)
-    else:
-        grid_positions.add(grid_pos)
+    grid_x, grid_y = mouse_pos[0] // TILE_SIZE, mouse_pos[1] // TILE_SIZE
+    grid[grid_y, grid_x] ^= 1
 
-    return grid_positions
+    return grid
 
 
 def main():
@@ -244,34 +732,79 @@ def main():
         None
     """
 
-    grid_positions = set()
+    grid = np.zeros((ROWS, COLS), dtype=np.uint8)
+    next_grid = np.zeros((ROWS, COLS), dtype=np.uint8) # buffer for the next generation, swapped with grid on every update
 
     running = True
     playing = False
     count = 0 # keeps track of the number of frames passed since the last grid update
     iteration = 0 # keeps track of the number of iterations passed since the start of the simulation
+    redraw = True # whether the whole screen must be redrawn, otherwise only the cells changed by the last update are
+    changed_cells = []
+    live_positions = None # live cells of grid while it is nearly empty, kept between updates instead of grid being scanned
+    paused_caption = False # whether the window caption currently shows the paused state
+    adaptive_update = ADAPTIVE_UPDATE
+    update_freq = UPDATE_FREQ # number of frames between grid updates
+    update_time = 0 # moving average of the time taken by a grid update, in seconds
+
+    # compile the update kernels now rather than on the first update
+    apply_rules(np.ones((ROWS, COLS), dtype=np.uint8), next_grid)
+    if STEP_METHOD == "hashlife":
+        step_bitboard_grid(grid, next_grid) # used when hashlife falls back
 
     while running:
         clock.tick(FPS)
         
-        pygame.display.set_caption(f"Conway's Game of Life Simulation - Playing - Iteration {iteration}" if playing else "Conway's Game of Life Simulation - Paused")
-
         if playing:
+            pygame.display.set_caption(f"Conway's Game of Life Simulation - Playing - Iteration {iteration}")
+            paused_caption = False
             count = count + 1
             iteration = iteration + 1
-        
-        if count >= UPDATE_FREQ:
-            count = 0
-            grid_positions =  apply_rules(grid_positions)
 
-        for event in pygame.event.get():
-            grid_positions, count, playing, running, iteration = handle_event(event, grid_positions, count, playing, running, iteration)
-
-        screen.fill(GRAY)
-        draw_grid(screen)
-        draw_positions(screen, grid_positions)
+            if count >= update_freq:
+                count = 0
+                start_time = time.perf_counter()
+                if live_positions is None and STEP_METHOD != "hashlife" and np.count_nonzero(grid) < SPARSE_DENSITY * ROWS * COLS:
+                    live_positions = grid_to_positions(grid)
+                if live_positions is not None:
+                    # few enough changed cells come out of the live cells to redraw them one by one
+                    live_positions, changed_cells = apply_sparse_rules(grid, live_positions)
+                    if len(live_positions) >= SPARSE_DENSITY * ROWS * COLS:
+                        live_positions = None # back to the STEP_METHOD kernel on the next update
+                    update_time += UPDATE_TIME_SMOOTHING * (time.perf_counter() - start_time - update_time)
+                else:
+                    grid, next_grid = apply_rules(grid, next_grid), grid
+                    update_time += UPDATE_TIME_SMOOTHING * (time.perf_counter() - start_time - update_time)
+                    changed = grid != next_grid
+                    # only list the changed cells when few enough of them are redrawn one by one
+                    if np.count_nonzero(changed) > MAX_DIRTY_CELLS:
+                        redraw = True
+                    else:
+                        # nonzero is much faster on a flat bool array than on a 2D one
+                        changed_cells = [divmod(position, COLS) for position in np.flatnonzero(changed).tolist()]
+        elif not paused_caption:
+            # the paused caption never changes, set it once when pausing
+            pygame.display.set_caption("Conway's Game of Life Simulation - Paused")
+            paused_caption = True
 
-        pygame.display.update()
+        for event in pygame.event.get():
+            grid, count, playing, running, iteration, adaptive_update = handle_event(event, grid, count, playing, running, iteration, adaptive_update)
+            # the grid may have been cleared, replaced or clicked, or the window uncovered
+            if event.type in (pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN, pygame.VIDEOEXPOSE):
+                redraw = True
+                live_positions = None # listed again from the grid on the next update
+
+        # in adaptive mode, update every frame unless an update takes longer than a frame
+        update_freq = max(1, math.ceil(update_time * FPS)) if adaptive_update else UPDATE_FREQ
+
+        if redraw:
+            screen.blit(grid_background, (0, 0))
+            draw_positions(screen, grid)
+            pygame.display.update()
+            redraw = False
+        elif changed_cells:
+            pygame.display.update(draw_changed_cells(screen, grid, changed_cells))
+        changed_cells = []
 
     pygame.quit()
 